@@ -1,10 +1,15 @@
 import unittest
-import subprocess
+import errno
+from unittest import mock
 import os
 import shutil
 import tempfile
-import filecmp
 import time
+import mmap
+import types
+
+import sync_to_ssds
+from sync_to_ssds import SyncManager, start_watching
 
 class SyncToSSDsTest(unittest.TestCase):
     """Test suite for sync_to_ssds.py"""
@@ -13,103 +18,120 @@ class SyncToSSDsTest(unittest.TestCase):
         """
         Set up the target and mirror directories before each test.
         """
-        # Set the target directory to 'Sample_Telemetry_Data'
-        self.target_dir = 'Sample_Telemetry_Data'
-        
-        # Set the mirror directory to '/mnt/e'
-        self.mirror_dir1 = '/mnt/e'
-        # self.mirror_dir2 = '/mnt/e2'  # If you have multiple mirror drives
-        self.mirror_drives = [self.mirror_dir1]
+        # Work on a scratch copy of 'Sample_Telemetry_Data' so tests can add and delete files
+        self.tmp_dir = tempfile.mkdtemp()
+        self.target_dir = os.path.join(self.tmp_dir, 'Sample_Telemetry_Data')
+        shutil.copytree('Sample_Telemetry_Data', self.target_dir)
+
+        # Plain directories stand in for mounted mirror drives
+        self.mirror_dir1 = os.path.join(self.tmp_dir, 'mirror1')
+        self.mirror_dir2 = os.path.join(self.tmp_dir, 'mirror2')
+        self.mirror_drives = [self.mirror_dir1, self.mirror_dir2]
+        for mirror in self.mirror_drives:
+            os.mkdir(mirror)
+
+        self.sync_manager = SyncManager(self.target_dir, self.mirror_drives, digest_cache_path=None)
+        self.observer = None
+        self.event_handler = None
 
     def tearDown(self):
         """
-        Clean up after each test. Since we're using existing directories,
-        we typically do not delete them. Uncomment and modify if cleanup is needed.
+        Clean up after each test.
         """
-        # Example cleanup (if necessary):
-        # shutil.rmtree(self.target_dir)
-        # shutil.rmtree(self.mirror_dir1)
-        # shutil.rmtree(self.mirror_dir2)
-        pass
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.event_handler.stop()
+        self.sync_manager.shutdown()
+        shutil.rmtree(self.tmp_dir)
 
     def run_sync(self):
         """
-        Execute the sync_to_ssds.py script with the target directory and mirror drives.
-        Runs the script for a limited time and then terminates it to prevent infinite looping.
-        """
-        cmd = ['python', 'sync_to_ssds.py', self.target_dir] + self.mirror_drives
-        try:
-            # Start the sync_to_ssds.py script as a subprocess
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            
-            # Allow the script to run for a specified duration (e.g., 5 seconds)
-            time_to_run = 5  # seconds
-            time.sleep(time_to_run)
-            
-            # Terminate the subprocess gracefully
-            process.terminate()
-            
-            try:
-                # Wait for the process to terminate, with a timeout
-                process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                # If the process does not terminate, kill it forcefully
-                process.kill()
-                process.wait()
-            
-            # Optionally, capture and handle output or errors
-            # stdout, stderr = process.communicate()
-            # if process.returncode != 0:
-            #     self.fail(f"sync_to_ssds.py failed with return code {process.returncode}.\nStderr: {stderr.decode()}")
-        
-        except Exception as e:
-            self.fail(f"Failed to run sync_to_ssds.py: {e}")
+        Run the initial sync of the target directory to the mirror drives in-process.
+        """
+        with mock.patch.object(SyncManager, 'is_drive_mounted', return_value=True):
+            self.sync_manager.initial_sync()
+
+    def start_watching(self):
+        """
+        Start mirroring changes made to the target directory, as the script does after its initial sync.
+        """
+        self.observer, self.event_handler = start_watching(self.sync_manager)
 
     def compare_files(self, file1, file2):
         """
         Compare two files based on their content.
+        Both files are mapped and compared in C, so no per-chunk Python loop is needed.
+        """
+        if os.path.getsize(file1) != os.path.getsize(file2):
+            return False
+        if os.path.getsize(file1) == 0:
+            return True
+        with open(file1, 'rb') as f1, open(file2, 'rb') as f2, \
+                mmap.mmap(f1.fileno(), 0, access=mmap.ACCESS_READ) as m1, \
+                mmap.mmap(f2.fileno(), 0, access=mmap.ACCESS_READ) as m2, \
+                memoryview(m1) as v1, memoryview(m2) as v2:
+            return v1 == v2
+
+    def index_directory(self, root):
+        """
+        Map every path under root (relative to root) to its stat result, or None for directories.
         """
-        return filecmp.cmp(file1, file2, shallow=False)
+        index = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            rel_dir = os.path.relpath(dirpath, root)
+            for name in dirnames:
+                index[os.path.normpath(os.path.join(rel_dir, name))] = None
+            for name in filenames:
+                index[os.path.normpath(os.path.join(rel_dir, name))] = os.stat(os.path.join(dirpath, name))
+        return index
 
     def compare_directories_recursively(self, dir1, dir2):
         """
         Recursively compare two directories, including file contents.
+        Both trees are indexed once and diffed by relative path.
         """
-        comparison = filecmp.dircmp(dir1, dir2)
+        index1 = self.index_directory(dir1)
+        index2 = self.index_directory(dir2)
 
         # Check for files/folders only in dir1
-        if comparison.left_only:
-            self.fail(f"Directory {dir1} has extra items: {comparison.left_only}")
+        left_only = index1.keys() - index2.keys()
+        if left_only:
+            self.fail(f"Directory {dir1} has extra items: {sorted(left_only)}")
 
         # Check for files/folders only in dir2
-        if comparison.right_only:
-            self.fail(f"Directory {dir2} has extra items: {comparison.right_only}")
+        right_only = index2.keys() - index1.keys()
+        if right_only:
+            self.fail(f"Directory {dir2} has extra items: {sorted(right_only)}")
 
-        # Check for differing files
-        for file in comparison.diff_files:
-            file1 = os.path.join(dir1, file)
-            file2 = os.path.join(dir2, file)
+        # Check for differing files, reading contents only when size and mtime disagree
+        for rel_path, stat1 in index1.items():
+            stat2 = index2[rel_path]
+            if (stat1 is None) != (stat2 is None):
+                self.fail(f"File/directory mismatch: {rel_path}")
+            if stat1 is None:
+                continue
+            if stat1.st_size == stat2.st_size and stat1.st_mtime_ns == stat2.st_mtime_ns:
+                continue
+            file1 = os.path.join(dir1, rel_path)
+            file2 = os.path.join(dir2, rel_path)
             if not self.compare_files(file1, file2):
                 self.fail(f"File contents differ: {file1} vs {file2}")
 
-        # Recursively compare common subdirectories
-        for common_dir in comparison.common_dirs:
-            self.compare_directories_recursively(
-                os.path.join(dir1, common_dir),
-                os.path.join(dir2, common_dir)
-            )
-
     def compare_directories(self):
         """
-        Compare the contents of the target directory with each mirror drive recursively.
+        Compare the contents of the target directory with its copy on each mirror drive recursively.
         """
         for mirror in self.mirror_drives:
-            self.compare_directories_recursively(self.target_dir, mirror)
+            self.compare_directories_recursively(
+                self.target_dir,
+                os.path.join(mirror, os.path.basename(self.target_dir))
+            )
 
     def test_initial_sync(self):
         """
         Test Case 1:
-        Run sync_to_ssds.py and verify that mirror drives match the target directory.
+        Run the initial sync and verify that mirror drives match the target directory.
         """
         self.run_sync()
         self.compare_directories()
@@ -121,14 +143,15 @@ class SyncToSSDsTest(unittest.TestCase):
         """
         self.run_sync()
         self.compare_directories()
+        self.start_watching()
 
         # Add a new file to the target directory
         new_file_path = os.path.join(self.target_dir, 'new_file.txt')
         with open(new_file_path, 'w') as f:
             f.write('This is a new file added for testing.')
 
-        # Wait for the sync_to_ssds.py to detect and sync the change
-        time.sleep(2)  # Adjust sleep time as necessary based on sync_to_ssds.py's polling interval
+        # Wait for the watcher to detect and sync the change
+        self.assertTrue(self.sync_manager.wait_until_idle(5.0))
 
         self.compare_directories()
 
@@ -139,24 +162,396 @@ class SyncToSSDsTest(unittest.TestCase):
         """
         self.run_sync()
         self.compare_directories()
+        self.start_watching()
 
         # Add a new file to ensure there is something to delete
         new_file_path = os.path.join(self.target_dir, 'new_file.txt')
         with open(new_file_path, 'w') as f:
             f.write('This file will be deleted for testing purposes.')
 
-        # Wait for the sync_to_ssds.py to sync the new file
-        time.sleep(2)
+        # Wait for the watcher to sync the new file
+        self.assertTrue(self.sync_manager.wait_until_idle(5.0))
 
         self.compare_directories()
 
         # Delete the newly added file from the target directory
         os.remove(new_file_path)
 
-        # Wait for the sync_to_ssds.py to detect and sync the deletion
-        time.sleep(2)
+        # Wait for the watcher to detect and sync the deletion
+        self.assertTrue(self.sync_manager.wait_until_idle(5.0))
+
+        self.compare_directories()
+
+    def test_unplug_drives_one_after_another(self):
+        """
+        Test Case 4:
+        Unplug both mirror drives in turn and verify that each is marked unmounted.
+        """
+        partitions = [
+            types.SimpleNamespace(device='/dev/sdx1', mountpoint=self.mirror_dir1, fstype='ext4'),
+            types.SimpleNamespace(device='/dev/sdy1', mountpoint=self.mirror_dir2, fstype='ext4'),
+        ]
+        with mock.patch('psutil.disk_partitions', return_value=partitions):
+            self.sync_manager.initial_sync()
+        self.assertEqual(self.sync_manager.mounted_drives, set(self.mirror_drives))
+
+        for device_node in ('/dev/sdx1', '/dev/sdy1'):
+            partitions = [p for p in partitions if p.device != device_node]
+            with mock.patch('psutil.disk_partitions', return_value=partitions):
+                self.sync_manager.device_event(mock.Mock(device_node=device_node, action='remove'))
+        self.assertEqual(self.sync_manager.mounted_drives, set())
+
+    def test_same_size_edit_within_two_seconds(self):
+        """
+        Test Case 5:
+        Rewrite a file with same-size contents and an mtime under two seconds later,
+        and verify that a resync copies it.
+        """
+        path = os.path.join(self.target_dir, 'same_size.txt')
+        with open(path, 'w') as f:
+            f.write('AAAA')
+        self.run_sync()
+        st = os.stat(path)
+        with open(path, 'w') as f:
+            f.write('BBBB')
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        self.run_sync()
+        self.compare_directories()
+
+    def test_unchanged_files_skip_mirror_comparison(self):
+        """
+        Test Case 6:
+        Resync unchanged files and verify that they are skipped without comparing them with the
+        mirror, unless a different drive is now mounted in the mirror's place.
+        """
+        self.run_sync()
+        mirror = os.path.join(self.mirror_dir1, os.path.basename(self.target_dir))
+        with mock.patch('sync_to_ssds.files_equal', wraps=sync_to_ssds.files_equal) as files_equal:
+            self.sync_manager.copy_missing_files(self.target_dir, mirror)
+            files_equal.assert_not_called()
+            with mock.patch.object(SyncManager, 'mirror_identity', return_value=[0, 'another-drive']):
+                self.sync_manager.copy_missing_files(self.target_dir, mirror)
+            files_equal.assert_called()
+
+    def test_deleted_files_are_forgotten(self):
+        """
+        Test Case 7:
+        Delete a source file and verify that its mirror copy and copy record are both gone after a resync.
+        """
+        path = os.path.join(self.target_dir, 'short_lived.txt')
+        with open(path, 'w') as f:
+            f.write('Deleted before the next sync.')
+        self.run_sync()
+        mirror = os.path.join(self.mirror_dir1, os.path.basename(self.target_dir))
+        mirror_file = os.path.join(mirror, 'short_lived.txt')
+        self.assertIn(mirror_file, self.sync_manager.copy_records(mirror))
+
+        os.remove(path)
+        self.run_sync()
+        self.compare_directories()
+        self.assertNotIn(mirror_file, self.sync_manager.copy_records(mirror))
+
+    def test_unchanged_mirror_is_skipped(self):
+        """
+        Test Case 8:
+        Resync with nothing changed and verify that the mirror isn't walked again,
+        then change a file and verify that it is.
+        """
+        # Changes within a second of a sync starting don't count as synced
+        time.sleep(1.1)
+        self.run_sync()
+        with mock.patch.object(SyncManager, 'copy_missing_files') as copy_missing_files:
+            self.run_sync()
+            copy_missing_files.assert_not_called()
+
+        with open(os.path.join(self.target_dir, 'new_file.txt'), 'w') as f:
+            f.write('Added after the last sync.')
+        self.run_sync()
+        self.compare_directories()
+
+    def test_other_directory_with_same_name_is_synced(self):
+        """
+        Test Case 9:
+        Sync a different directory with the same name to the same mirror and cache,
+        and verify that it replaces the first one's mirror.
+        """
+        cache_path = os.path.join(self.tmp_dir, 'digests.json')
+        for source, name in (('a', 'from_a'), ('b', 'from_b')):
+            os.makedirs(os.path.join(self.tmp_dir, source, 'data'))
+            with open(os.path.join(self.tmp_dir, source, 'data', name), 'w') as f:
+                f.write(name)
+        # Neither directory may have changed after the first sync starts
+        time.sleep(1.1)
+        for source in ('a', 'b'):
+            target_dir = os.path.join(self.tmp_dir, source, 'data')
+            sync_manager = SyncManager(target_dir, [self.mirror_dir1], digest_cache_path=cache_path)
+            with mock.patch.object(SyncManager, 'is_drive_mounted', return_value=True):
+                sync_manager.initial_sync()
+            sync_manager.shutdown()
+        self.assertEqual(os.listdir(os.path.join(self.mirror_dir1, 'data')), ['from_b'])
+
+    def test_file_replaced_by_directory(self):
+        """
+        Test Case 10:
+        Replace a file with a directory of the same name and verify that the
+        mirrors replace their copy of the file with the directory.
+        """
+        replaced_path = os.path.join(self.target_dir, 'replaced')
+        with open(replaced_path, 'w') as f:
+            f.write('This file will become a directory.')
+        self.run_sync()
+        self.start_watching()
+
+        # Delete, recreate and fill the path quickly enough to land in one batch
+        os.remove(replaced_path)
+        os.mkdir(replaced_path)
+        with open(os.path.join(replaced_path, 'inner.txt'), 'w') as f:
+            f.write('This file is inside the new directory.')
+
+        self.assertTrue(self.sync_manager.wait_until_idle(5.0))
+        self.compare_directories()
+
+    def test_types_swapped_between_syncs(self):
+        """
+        Test Case 11:
+        Replace a file with a directory and a directory with a file between two
+        syncs, and verify that the second sync swaps them on the mirrors too.
+        """
+        file_path = os.path.join(self.target_dir, 'was_file')
+        dir_path = os.path.join(self.target_dir, 'was_dir')
+        with open(file_path, 'w') as f:
+            f.write('This file will become a directory.')
+        os.mkdir(dir_path)
+        with open(os.path.join(dir_path, 'inner.txt'), 'w') as f:
+            f.write('This directory will become a file.')
+        self.run_sync()
+
+        os.remove(file_path)
+        os.mkdir(file_path)
+        with open(os.path.join(file_path, 'inner.txt'), 'w') as f:
+            f.write('This file is inside the new directory.')
+        shutil.rmtree(dir_path)
+        with open(dir_path, 'w') as f:
+            f.write('This file replaced a directory.')
+        self.run_sync()
+        self.compare_directories()
+
+    def test_delete_directory(self):
+        """
+        Test Case 12:
+        Delete a directory tree from the target directory and verify that it is removed from all mirror drives.
+        """
+        tree_path = os.path.join(self.target_dir, 'tree')
+        os.makedirs(os.path.join(tree_path, 'nested'))
+        for name in ('one.txt', os.path.join('nested', 'two.txt')):
+            with open(os.path.join(tree_path, name), 'w') as f:
+                f.write('This tree will be deleted.')
+        self.run_sync()
+        self.start_watching()
+
+        shutil.rmtree(tree_path)
+
+        self.assertTrue(self.sync_manager.wait_until_idle(5.0))
+        self.compare_directories()
+
+    def test_batch_coalescing(self):
+        """
+        Test Case 13:
+        Coalesce a batch of events and verify that paths covered by a directory update
+        or delete are dropped, but deletes below an updated directory still run.
+        Then verify that a move keeps the updates before it, as when a log is rotated.
+        """
+        handler = sync_to_ssds.DirectoryEventHandler(self.sync_manager)
+        updated = os.path.join(self.target_dir, 'updated')
+        deleted = os.path.join(self.target_dir, 'deleted')
+        events = handler.coalesce([
+            ('update', os.path.join(updated, 'file.txt')),
+            ('update', updated),
+            ('delete', os.path.join(updated, 'old.txt')),
+            ('update', os.path.join(updated, 'file.txt')),
+            ('delete', os.path.join(deleted, 'file.txt')),
+            ('delete', deleted),
+        ])
+        self.assertEqual(events, [
+            ('update', updated),
+            ('delete', os.path.join(updated, 'old.txt')),
+            ('delete', deleted),
+        ])
+
+        log_path = os.path.join(self.target_dir, 'app.log')
+        events = handler.coalesce([
+            ('update', log_path),
+            ('move', log_path, log_path + '.1'),
+            ('update', log_path),
+        ])
+        self.assertEqual(events, [
+            ('update', log_path),
+            ('move', log_path, log_path + '.1'),
+            ('update', log_path + '.1'),
+            ('update', log_path),
+        ])
+
+    def test_move_missing_from_mirror(self):
+        """
+        Test Case 14:
+        Move a file and a directory whose old paths the mirrors never had, and a file
+        into a directory the mirrors don't have yet, and verify that the mirrors match.
+        """
+        kept_path = os.path.join(self.target_dir, 'kept.txt')
+        with open(kept_path, 'w') as f:
+            f.write('This file is on the mirrors before it is moved.')
+        self.run_sync()
 
+        unsynced_file = os.path.join(self.target_dir, 'unsynced.txt')
+        unsynced_dir = os.path.join(self.target_dir, 'unsynced')
+        with open(unsynced_file, 'w') as f:
+            f.write('This file never reached the mirrors.')
+        os.mkdir(unsynced_dir)
+        with open(os.path.join(unsynced_dir, 'inner.txt'), 'w') as f:
+            f.write('Neither did this directory.')
+        moves = [
+            (unsynced_file, os.path.join(self.target_dir, 'moved.txt')),
+            (unsynced_dir, os.path.join(self.target_dir, 'moved')),
+            (kept_path, os.path.join(self.target_dir, 'new_dir', 'kept.txt')),
+        ]
+        os.mkdir(os.path.join(self.target_dir, 'new_dir'))
+        for src, dest in moves:
+            os.rename(src, dest)
+            self.sync_manager.handle_move(src, dest)
         self.compare_directories()
 
+    def test_move_across_filesystems(self):
+        """
+        Test Case 15:
+        Move a file and a directory with a rename that fails across filesystems, and
+        verify that they are copied to the new path and removed from the old one.
+        """
+        src_dir = os.path.join(self.tmp_dir, 'src_dir')
+        os.makedirs(os.path.join(src_dir, 'nested'))
+        with open(os.path.join(src_dir, 'nested', 'inner.txt'), 'w') as f:
+            f.write('This directory is moved.')
+        src_file = os.path.join(self.tmp_dir, 'src_file.txt')
+        with open(src_file, 'w') as f:
+            f.write('This file is moved.')
+
+        exdev = OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        with mock.patch('os.replace', side_effect=exdev):
+            sync_to_ssds.move_path(src_dir, os.path.join(self.tmp_dir, 'dest_dir'))
+            sync_to_ssds.move_path(src_file, os.path.join(self.tmp_dir, 'dest_file.txt'))
+        self.assertFalse(os.path.lexists(src_dir))
+        self.assertFalse(os.path.lexists(src_file))
+        with open(os.path.join(self.tmp_dir, 'dest_dir', 'nested', 'inner.txt')) as f:
+            self.assertEqual(f.read(), 'This directory is moved.')
+        with open(os.path.join(self.tmp_dir, 'dest_file.txt')) as f:
+            self.assertEqual(f.read(), 'This file is moved.')
+
+    def test_verify_compares_contents(self):
+        """
+        Test Case 16:
+        Sync with verify set to mirror files whose mtime differs from the source, and
+        verify that only the one whose contents also differ is copied.
+        """
+        mirror = os.path.join(self.mirror_dir1, os.path.basename(self.target_dir))
+        os.mkdir(mirror)
+        for name, mirror_contents in (('same.txt', 'Same contents'), ('differs.txt', 'Other content')):
+            with open(os.path.join(self.target_dir, name), 'w') as f:
+                f.write('Same contents')
+            with open(os.path.join(mirror, name), 'w') as f:
+                f.write(mirror_contents)
+            os.utime(os.path.join(mirror, name), (0, 0))
+
+        sync_manager = SyncManager(self.target_dir, [self.mirror_dir1], digest_cache_path=None, verify=True)
+        with mock.patch.object(SyncManager, 'is_drive_mounted', return_value=True), \
+                mock.patch('sync_to_ssds.fast_copy', wraps=sync_to_ssds.fast_copy) as fast_copy:
+            sync_manager.initial_sync()
+        sync_manager.shutdown()
+        copied = {os.path.basename(call.args[1]) for call in fast_copy.call_args_list}
+        self.assertIn('differs.txt', copied)
+        self.assertNotIn('same.txt', copied)
+        self.compare_directories_recursively(self.target_dir, mirror)
+
+    def test_drive_full_removes_partial_copy(self):
+        """
+        Test Case 17:
+        Fill up the drive partway through copying a file, and verify that the partial
+        copy is removed while the other files are still synced.
+        """
+        full_path = os.path.join(self.target_dir, 'too_big.bin')
+        with open(full_path, 'wb') as f:
+            f.write(b'\0' * 4096)
+        real_fast_copy = sync_to_ssds.fast_copy
+
+        def fill_up(src, dst):
+            if os.path.basename(dst) != 'too_big.bin':
+                return real_fast_copy(src, dst)
+            with open(dst, 'wb') as f:
+                f.write(b'\0' * 1024)
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+
+        with mock.patch('sync_to_ssds.fast_copy', side_effect=fill_up):
+            self.run_sync()
+        for mirror in self.mirror_drives:
+            mirror = os.path.join(mirror, os.path.basename(self.target_dir))
+            self.assertFalse(os.path.lexists(os.path.join(mirror, 'too_big.bin')))
+        os.remove(full_path)
+        self.compare_directories()
+
+    def test_log_rotation(self):
+        """
+        Test Case 18:
+        Append to a log, rotate it and start a new one in a single batch, and verify
+        that the mirrors get the rotated log with the appended data.
+        """
+        log_path = os.path.join(self.target_dir, 'app.log')
+        with open(log_path, 'w') as f:
+            f.write('line1\n')
+        self.run_sync()
+
+        with open(log_path, 'a') as f:
+            f.write('line2\n')
+        os.rename(log_path, log_path + '.1')
+        with open(log_path, 'w') as f:
+            f.write('new\n')
+        handler = sync_to_ssds.DirectoryEventHandler(self.sync_manager)
+        handler.process_batch([
+            ('update', log_path),
+            ('move', log_path, log_path + '.1'),
+            ('update', log_path),
+        ])
+        self.compare_directories()
+
+    def test_busy_drive_does_not_hold_up_others(self):
+        """
+        Test Case 19:
+        Add a file while one mirror drive is locked by a sync pass, and verify that the
+        other drive gets it straight away and the locked one once its lock is released.
+        """
+        self.run_sync()
+        handler = sync_to_ssds.DirectoryEventHandler(self.sync_manager)
+        new_file_path = os.path.join(self.target_dir, 'new_file.txt')
+        with open(new_file_path, 'w') as f:
+            f.write('This file is added while a drive is busy.')
+        mirrored = [os.path.join(mirror, os.path.basename(self.target_dir), 'new_file.txt')
+                    for mirror in self.mirror_drives]
+
+        with self.sync_manager._drive_lock(self.mirror_dir1):
+            handler.process_batch([('update', new_file_path)])
+            self.assertFalse(os.path.exists(mirrored[0]))
+            self.assertTrue(os.path.exists(mirrored[1]))
+        handler.process_batch([])
+        self.assertEqual(handler.deferred, {})
+        self.compare_directories()
+
+    def test_progress_logged_at_end_of_pass(self):
+        """
+        Test Case 20:
+        Run a sync that finishes within one progress interval and verify that its
+        copies are still summarised, and not carried over into the next pass.
+        """
+        with self.assertLogs('sync_to_ssds', level='INFO') as logs:
+            self.run_sync()
+        self.assertTrue(any(line.startswith('INFO:sync_to_ssds:Copied') for line in logs.output))
+        self.assertEqual(self.sync_manager._progress, {'files': 0, 'bytes': 0, 'deleted': 0})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -5,128 +5,678 @@ import threading
 import argparse
 from pathlib import Path
 import psutil
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from watchdog.events import (FileSystemEventHandler, FileCreatedEvent, DirCreatedEvent, FileModifiedEvent,
+                             FileMovedEvent, DirMovedEvent, FileDeletedEvent, DirDeletedEvent)
 import pyudev
 import hashlib
 import sys
 import inquirer
+import json
+import errno
+import queue
+import signal
+import logging
+import stat
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+# Holds each thread's reusable I/O buffers, see _thread_buffers()
+_local = threading.local()
+
+if sys.platform.startswith('linux'):
+    import fcntl
+    # Use inotify directly so a broken setup fails instead of silently degrading to polling
+    from watchdog.observers.inotify import InotifyObserver
+    # Python only exposes fcntl.FICLONE from 3.12
+    FICLONE = getattr(fcntl, 'FICLONE', 0x40049409)
+else:
+    from watchdog.observers.polling import PollingObserver
+    FICLONE = None
+
+# Only used to detect changed files, so take the fastest hash that's installed
+try:
+    from blake3 import blake3 as checksum_hash
+except ImportError:
+    try:
+        from xxhash import xxh3_128 as checksum_hash
+    except ImportError:
+        checksum_hash = hashlib.blake2b
+CHECKSUM_ALGORITHM = checksum_hash().name
+# Below this size, starting BLAKE3's worker threads costs more than it saves. Above it,
+# files are fed to the hash in PARALLEL_HASH_CHUNK reads so every thread gets a share.
+PARALLEL_HASH_MIN_SIZE = 64 << 20
+PARALLEL_HASH_CHUNK = 16 << 20
+# Files at least this big are dropped from the page cache once hashed, since a verify pass
+# reads them only once and would otherwise push out data that's actually in use
+UNCACHED_HASH_MIN_SIZE = 64 << 20
+
+# Upper bound per copy_file_range/sendfile call; the kernel caps it near 2 GiB anyway
+KERNEL_COPY_CHUNK = 1 << 30
+# Raised when the kernel can't copy between these two files, before anything is written
+KERNEL_COPY_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+# Poll interval where inotify isn't available. Polling snapshots every file's stat each
+# interval (never contents), so shorter intervals cost proportionally more CPU and I/O.
+POLLING_INTERVAL = 2.0
+
+# Re-read free space with statvfs after this many bytes were copied on a local estimate,
+# or once the estimate is this many seconds old, since other writers share the drive
+SPACE_RESYNC_BYTES = 64 << 20
+SPACE_RESYNC_INTERVAL = 1.0
+
+# Seconds between aggregate progress lines when not running verbose
+PROGRESS_INTERVAL = 1.0
+
+# Copy/delete jobs allowed on the executor at once, across all sync passes
+MAX_QUEUED_JOBS = 256
+
+# Size of each per-thread buffer used when data has to pass through user space
+IO_BUFFER_SIZE = 1 << 20
+
+# Watchdog events are batched until the directory is quiet for EVENT_DEBOUNCE seconds
+EVENT_DEBOUNCE = 0.5
+EVENT_BATCH_MAX_WAIT = 5.0
+# Seconds between retries of changes held back for a drive busy with a sync pass
+BUSY_DRIVE_RETRY = 1.0
+# The only events DirectoryEventHandler acts on. Filtering also narrows the inotify mask, so
+# the kernel stops queueing open/close events, including those caused by our own copies.
+WATCHED_EVENTS = [FileCreatedEvent, DirCreatedEvent, FileModifiedEvent,
+                  FileMovedEvent, DirMovedEvent, FileDeletedEvent, DirDeletedEvent]
+
+DIGEST_CACHE_PATH = Path.home() / '.cache' / 'auto-mirror' / 'digests.json'
+
+# Mirror filesystems that store modification times less precisely than copystat sets
+# them, and how far a copy's mtime may be off. Everything else keeps nanoseconds, so
+# there a copy's mtime has to match exactly.
+MTIME_TOLERANCE_NS = {
+    # FAT stores 2 second resolution, exFAT 10 ms
+    'vfat': 2_000_000_000, 'msdos': 2_000_000_000, 'exfat': 10_000_000,
+    # FUSE exFAT/NTFS drivers and WSL drives can all be backed by FAT
+    'fuseblk': 2_000_000_000, '9p': 2_000_000_000, 'drvfs': 2_000_000_000,
+    # NTFS stores 100 ns ticks
+    'ntfs': 100, 'ntfs3': 100,
+}
 
 class SyncManager:
-    def __init__(self, dir_to_watch, mirror_drives):
+    def __init__(self, dir_to_watch, mirror_drives, digest_cache_path=DIGEST_CACHE_PATH, verify=False):
         self.dir_to_watch = Path(dir_to_watch).resolve()
         if not self.dir_to_watch.exists():
-            print(f"Error: Directory to watch '{self.dir_to_watch}' does not exist.")
+            logger.error("Directory to watch '%s' does not exist.", self.dir_to_watch)
             sys.exit(1)
         self.mirror_drives = mirror_drives
+        # Each mirror drive's resolved mount point, and back; symlinks are resolved once here
+        self._drive_mount_points = {}
+        for drive in mirror_drives:
+            drive_path = drive['value'] if isinstance(drive, dict) else drive
+            self._drive_mount_points[drive_path] = os.path.realpath(drive_path)
+        self._mount_point_drives = {mount_point: drive_path
+                                    for drive_path, mount_point in self._drive_mount_points.items()}
+        # Each mirror drive's copy of the watched directory, built once instead of per event
+        self._destinations = {drive_path: Path(drive_path) / self.dir_to_watch.name
+                              for drive_path in self._drive_mount_points}
         self.mounted_drives = set()
-        self.lock = threading.Lock()
+        # _drives_lock only guards mounted_drives. Work on a mirror holds that drive's own
+        # lock, so a long copy to one drive doesn't hold up changes to the others.
+        self._drives_lock = threading.Lock()
+        self._drive_locks = {drive_path: threading.Lock() for drive_path in self._drive_mount_points}
+        self.space_lock = threading.Lock()
+        # Per mirror root: free bytes estimate, bytes debited since the last statvfs,
+        # when that statvfs ran, and bytes reserved by copies still running
+        self._free_space = {}
+        self._debited_space = {}
+        self._free_space_read = {}
+        self._in_flight_space = {}
+        self.progress_lock = threading.Lock()
+        self._progress = {'files': 0, 'bytes': 0, 'deleted': 0}
+        self._last_progress = time.monotonic()
+        self._failures = 0
+        # Set by the event worker whenever it has drained every queued change
+        self.changes_synced = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4))
+        self._job_slots = threading.BoundedSemaphore(MAX_QUEUED_JOBS)
         self.context = pyudev.Context()
         self.monitor = pyudev.Monitor.from_netlink(self.context)
         self.monitor.filter_by('block')
+        self._mount_table = None
+        # Mirror root -> MTIME_TOLERANCE_NS for its filesystem, cleared when the mount table is re-read
+        self._mtime_tolerances = {}
         self.MAX_STORAGE_LIMIT = 0.95  # 95% usage threshold
+        # Also compare checksums of files whose size matches but mtime doesn't
+        self.verify = verify
+        # Persisted together in digest_cache_path:
+        # path -> (size, mtime_ns, digest), reused until the file's stat changes
+        self._digest_cache = {}
+        # mirror directory -> (source mtime_ns, mirror mtime_ns) of its last clean delete pass
+        self._dir_fingerprints = {}
+        # mirror root -> {'identity': mirror_identity(), 'files': {mirror file: (source size,
+        # source mtime_ns, mirror inode)}} for files _fast_copy copied or found equal
+        self._copy_records = {}
+        # drive -> (start time_ns, watched directory, mirror_identity(), mirror root inode)
+        # of its last clean sync_directory
+        self._sync_stamps = {}
+        # Mirror root -> mirror_identity(), cleared when the mount table is re-read
+        self._mirror_identities = {}
+        self.digest_cache_path = digest_cache_path
+        self.load_digest_cache()
+
+    def wait_until_idle(self, timeout=None):
+        # Returns False if no batch of changes finished syncing within timeout
+        synced = self.changes_synced.wait(timeout)
+        self.changes_synced.clear()
+        return synced
+
+    def shutdown(self):
+        self.executor.shutdown()
+        self.save_digest_cache()
+
+    def load_digest_cache(self):
+        if self.digest_cache_path is None or not Path(self.digest_cache_path).exists():
+            return
+        try:
+            with open(self.digest_cache_path) as f:
+                cache = json.load(f)
+            # Digests from a different hash can't be compared with new ones
+            if cache.get('algorithm') == CHECKSUM_ALGORITHM:
+                self._digest_cache = {path: tuple(entry) for path, entry in cache['entries'].items()}
+            self._dir_fingerprints = {path: tuple(entry) for path, entry in cache.get('dirs', {}).items()}
+            self._copy_records = {
+                root: {'identity': records['identity'],
+                       'files': {path: tuple(entry) for path, entry in records['files'].items()}}
+                for root, records in cache.get('copies', {}).items()
+            }
+            self._sync_stamps = {drive: tuple(stamp) for drive, stamp in cache.get('synced', {}).items()}
+        except (OSError, ValueError, KeyError, AttributeError, TypeError) as e:
+            logger.error("Error loading digest cache %s: %s", self.digest_cache_path, e)
+
+    def save_digest_cache(self):
+        if self.digest_cache_path is None:
+            return
+        try:
+            Path(self.digest_cache_path).parent.mkdir(parents=True, exist_ok=True)
+            # Copy the maps first: dict() copies in one step under the GIL, while
+            # json.dump would iterate them as copy and drive threads add entries
+            cache = {'algorithm': CHECKSUM_ALGORITHM, 'entries': dict(self._digest_cache),
+                     'dirs': dict(self._dir_fingerprints),
+                     'copies': {root: {'identity': records['identity'], 'files': dict(records['files'])}
+                                for root, records in list(self._copy_records.items())},
+                     'synced': dict(self._sync_stamps)}
+            # Write beside the cache and swap it in, so a crash mid-write keeps the old one
+            tmp_path = f"{self.digest_cache_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.digest_cache_path)
+        except OSError as e:
+            logger.error("Error saving digest cache %s: %s", self.digest_cache_path, e)
+
+    def file_checksum(self, path):
+        path = os.fspath(path)
+        st = os.stat(path)
+        cached = self._digest_cache.get(path)
+        if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = file_checksum(path)
+        self._digest_cache[path] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
 
     def get_available_space(self, drive):
         usage = shutil.disk_usage(drive)
-        print(usage)
+        logger.debug("Drive %s usage: %s", drive, usage)
         return usage.free
 
-    def has_enough_space(self, drive, required_space):
-        available = self.get_available_space(drive)
-        # TODO
-        print(f"Drive {drive} has {available}. Required space is {required_space}")
-        return available >= required_space
-
     def initial_sync(self):
+        drive_paths = []
         for drive in self.mirror_drives:
             if isinstance(drive, dict):
                 drive_path = drive['value']
             else:
                 drive_path = drive
             if self.is_drive_mounted(drive_path):
-                self.mounted_drives.add(drive_path)
-                self.sync_directory(drive_path)
+                with self._drives_lock:
+                    self.mounted_drives.add(drive_path)
+                drive_paths.append(drive_path)
             else:
-                print(f"Drive {drive_path} is not mounted. Skipping.")
+                logger.info("Drive %s is not mounted. Skipping.", drive_path)
+        if not drive_paths:
+            return
+        # Each mirror is its own device, so sync them side by side; their files are
+        # still copied on the shared executor
+        with ThreadPoolExecutor(max_workers=len(drive_paths)) as drive_executor:
+            list(drive_executor.map(self.sync_directory, drive_paths))
+
+    def mount_table(self, refresh=False):
+        """Return {mount point: partition} for every mounted filesystem.
+
+        Keyed by mount point because one device can be mounted in several places,
+        e.g. btrfs subvolumes or bind mounts. Filesystems without a block device are
+        kept too, since mirrors can be network or WSL drvfs mounts. The table is
+        cached until refresh is set, which device_event does when a device changes.
+        """
+        # Read the attribute once: copy workers call this while the pyudev thread replaces it
+        table = self._mount_table
+        if table is None or refresh:
+            table = self._mount_table = {partition.mountpoint: partition
+                                         for partition in psutil.disk_partitions(all=True)}
+        return table
 
     def is_drive_mounted(self, drive):
-        partitions = psutil.disk_partitions(all=True)
-        for partition in partitions:
-            if os.path.realpath(drive) == os.path.realpath(partition.mountpoint):
-                return True
-        return False
+        mount_point = self._drive_mount_points.get(drive) or os.path.realpath(drive)
+        return mount_point in self.mount_table()
+
+    def partition_for(self, path):
+        """Return the mount table entry for the filesystem holding path, or None."""
+        table = self.mount_table()
+        mount_point = os.path.realpath(path)
+        while mount_point not in table and mount_point != os.path.dirname(mount_point):
+            mount_point = os.path.dirname(mount_point)
+        return table.get(mount_point)
+
+    def mtime_tolerance(self, path):
+        """Return how far a copy's mtime may differ from its source on the filesystem holding path."""
+        path = os.fspath(path)
+        tolerance = self._mtime_tolerances.get(path)
+        if tolerance is None:
+            partition = self.partition_for(path)
+            tolerance = MTIME_TOLERANCE_NS.get(partition.fstype, 0) if partition is not None else 0
+            self._mtime_tolerances[path] = tolerance
+        return tolerance
+
+    def mirror_identity(self, destination):
+        """Identify the filesystem a mirror root is on, or return None if it doesn't exist.
+
+        Returns [st_dev, filesystem UUID or None]. A USB drive swapped for another one in
+        the same port usually gets the same st_dev, so the UUID udev read from the
+        filesystem is what tells them apart where it's known.
+        """
+        destination = os.fspath(destination)
+        identity = self._mirror_identities.get(destination)
+        if identity is None:
+            try:
+                st_dev = os.stat(destination).st_dev
+            except OSError:
+                return None
+            uuid = None
+            partition = self.partition_for(destination)
+            if partition is not None and partition.device.startswith('/dev/'):
+                try:
+                    uuid = pyudev.Devices.from_device_file(self.context, partition.device).get('ID_FS_UUID')
+                except (pyudev.DeviceNotFoundError, OSError, ValueError):
+                    pass
+            identity = self._mirror_identities[destination] = [st_dev, uuid]
+        return identity
+
+    def copy_records(self, destination):
+        """Return the _copy_records files map for a mirror root, or None if it can't be identified.
+
+        The map is started over whenever the mirror's identity changed since it was recorded.
+        """
+        identity = self.mirror_identity(destination)
+        if identity is None:
+            return None
+        destination = os.fspath(destination)
+        records = self._copy_records.get(destination)
+        if records is None or records['identity'] != identity:
+            records = self._copy_records[destination] = {'identity': identity, 'files': {}}
+        return records['files']
+
+    def _forget(self, file_paths=(), dir_paths=()):
+        # Drop cached state for deleted mirror paths, including everything under deleted directories
+        file_paths = [os.fspath(path) for path in file_paths]
+        dir_paths = [os.fspath(path) for path in dir_paths]
+        prefixes = tuple(path + os.sep for path in dir_paths)
+        caches = [self._digest_cache, self._dir_fingerprints]
+        caches.extend(records['files'] for records in list(self._copy_records.values()))
+        for cache in caches:
+            for path in file_paths + dir_paths:
+                cache.pop(path, None)
+            if prefixes:
+                for path in list(cache):
+                    if path.startswith(prefixes):
+                        cache.pop(path, None)
+
+    def mounted(self):
+        with self._drives_lock:
+            return list(self.mounted_drives)
+
+    def destination(self, drive):
+        """Return the directory on drive that mirrors the watched directory."""
+        destination = self._destinations.get(drive)
+        if destination is None:
+            destination = self._destinations.setdefault(drive, Path(drive) / self.dir_to_watch.name)
+        return destination
+
+    def _drive_lock(self, drive):
+        return self._drive_locks.setdefault(drive, threading.Lock())
+
+    @contextmanager
+    def _try_drive_lock(self, drive):
+        """Hold drive's lock if it's free, yielding whether it was taken."""
+        lock = self._drive_lock(drive)
+        locked = lock.acquire(blocking=False)
+        try:
+            yield locked
+        finally:
+            if locked:
+                lock.release()
 
 # TODO: CHECK MAX SIZE ISSUES
     def sync_directory(self, drive):
-        destination = Path(drive) / self.dir_to_watch.name
-        if not destination.exists():
+        with self._drive_lock(drive):
+            destination = self.destination(drive)
+            self._invalidate_free_space(destination)
+            # Filesystem timestamps come from a coarse clock, so back off a little
+            started = time.time_ns() - 1_000_000_000
             try:
-                # Create empty directory first
-                destination.mkdir(parents=True, exist_ok=True)
-                # Use copy_missing_files to populate it
+                if self.mirror_in_sync(drive, destination):
+                    logger.info("Drive %s unchanged since its last sync", drive)
+                    return
+                failures = self._failures
+                # A fresh mirror can't have anything to delete
+                existed = destination.exists()
                 self.copy_missing_files(self.dir_to_watch, destination)
-                print(f"Drive {drive} synced")
+                if existed:
+                    self.delete_extra_files(self.dir_to_watch, destination)
+                if self._failures == failures:
+                    self._sync_stamps[os.fspath(drive)] = (started, os.fspath(self.dir_to_watch),
+                                                           self.mirror_identity(destination),
+                                                           os.stat(destination).st_ino)
+                logger.info("Drive %s synced", drive)
             except Exception as e:
-                print(f"Error copying to {destination}: {e}")
-        else:
-            self.copy_missing_files(self.dir_to_watch, destination)
-            self.delete_extra_files(self.dir_to_watch, destination)
-            print(f"Drive {drive} synced")
-
-    def copy_missing_files(self, src, dest):
-        for root, dirs, files in os.walk(src):
-            rel_path = Path(root).relative_to(src)
-            dest_dir = dest / rel_path
-            if not dest_dir.exists():
+                logger.error("Error copying to %s: %s", destination, e)
+            finally:
+                self.flush_progress()
+
+    def mirror_in_sync(self, drive, destination):
+        """Tell whether nothing under the watched directory changed since drive's last clean sync.
+
+        Only source metadata is read: every entry's ctime, which also moves on renames and on
+        copies that preserve mtime. The stamp must also be for the same watched directory, since
+        another one with the same name mirrors to the same place, and for the same mirror,
+        in case another drive is now mounted in its place.
+        """
+        stamp = self._sync_stamps.get(os.fspath(drive))
+        if stamp is None or len(stamp) != 4:
+            return False
+        started, source, identity, mirror_inode = stamp
+        if source != os.fspath(self.dir_to_watch):
+            return False
+        try:
+            if identity is None or identity != self.mirror_identity(destination):
+                return False
+            if os.stat(destination).st_ino != mirror_inode:
+                return False
+            if os.stat(self.dir_to_watch).st_ctime_ns >= started:
+                return False
+        except FileNotFoundError:
+            return False
+        errors = []
+        for root, dirs, files in walk_entries(self.dir_to_watch, onerror=errors.append):
+            for entry in dirs + files:
                 try:
-                    dir_size = self.calculate_directory_size(root)
-                    print(f"Copying directory {dest_dir}")
-                    if self.has_enough_space(dest, dir_size):
-                        shutil.copytree(root, dest_dir)
-                        print(f"Copied directory {dest_dir}")
-                    else:
-                        print(f"Not enough space to copy directory {dest_dir}. Skipping.")
-                except Exception as e:
-                    print(f"Error copying directory {dest_dir}: {e}")
-            for file in files:
-                src_file = Path(root) / file
-                dest_file = dest_dir / file
-                if not dest_file.exists() or file_checksum(src_file) != file_checksum(dest_file):
+                    if entry.stat(follow_symlinks=False).st_ctime_ns >= started:
+                        return False
+                except FileNotFoundError:
+                    return False
+        return not errors
+
+    def copy_missing_files(self, src, dest, destination=None):
+        # destination is the mirror root whose free space the copies are charged to
+        if destination is None:
+            destination = dest
+        pending = set()
+        # Source directories whose mirror had to be created, so their subdirectories can't exist yet
+        created = set()
+        # Plain strings in the loop: walk_entries roots all start with src, and a pathlib
+        # object per file costs more than the rest of the per-file work on the walking thread
+        src_root = os.fspath(src)
+        dest_root = os.fspath(dest)
+        for root, dirs, files in walk_entries(src_root, onerror=lambda e: self._count_failure()):
+            dest_dir = dest_root + root[len(src_root):]
+            # List the mirror directory once: files missing from it need no stat at all, and
+            # the others are stat'ed through their DirEntry on the worker that compares them
+            dest_entries = None
+            if os.path.dirname(root) not in created:
+                try:
+                    with os.scandir(dest_dir) as it:
+                        dest_entries = {dest_entry.name: dest_entry for dest_entry in it}
+                except FileNotFoundError:
+                    pass
+                except NotADirectoryError:
+                    # The source file was replaced by a directory; make room for it
                     try:
-                        file_size = src_file.stat().st_size
-                        print(f"Copying file {dest_file}")
-                        if self.has_enough_space(dest, file_size):
-                            shutil.copy2(src_file, dest_file)
-                            print(f"Copied file {dest_file}")
-                        else:
-                            print(f"Not enough space to copy file {dest_file}. Skipping.")
-                    except Exception as e:
-                        print(f"Error copying file {dest_file}: {e}")
+                        os.remove(dest_dir)
+                        self._forget(file_paths=[dest_dir])
+                    except OSError as e:
+                        logger.error("Error removing file %s: %s", dest_dir, e)
+                        self._count_failure()
+                        dirs[:] = []
+                        continue
+                except OSError as e:
+                    logger.error("Error scanning directory %s: %s", dest_dir, e)
+                    self._count_failure()
+                    dirs[:] = []
+                    continue
+            if dest_entries is None:
+                dest_entries = {}
+                try:
+                    os.makedirs(dest_dir, exist_ok=True)
+                    logger.debug("Created directory %s", dest_dir)
+                except Exception as e:
+                    logger.error("Error creating directory %s: %s", dest_dir, e)
+                    self._count_failure()
+                    dirs[:] = []
+                    continue
+                if dirs:
+                    created.add(root)
+            for entry in files:
+                dest_entry = dest_entries.get(entry.name)
+                self._submit(pending, self._fast_copy, entry, os.path.join(dest_dir, entry.name), destination,
+                             compare=dest_entry is not None, dest_entry=dest_entry)
+        wait(pending.copy())
 
-    def delete_extra_files(self, src, dest):
-        for root, dirs, files in os.walk(dest, topdown=False):
-            rel_path = Path(root).relative_to(dest)
-            src_dir = src / rel_path
-            # Delete files not present in source
-            for file in files:
-                dest_file = Path(root) / file
-                src_file = src_dir / file
-                if not src_file.exists():
+    def _submit(self, pending, fn, *args, **kwargs):
+        # Blocks the caller's walk while MAX_QUEUED_JOBS are outstanding, so a huge tree
+        # doesn't build up a future (and a DirEntry) for every file before the copies catch up
+        self._job_slots.acquire()
+        try:
+            future = self.executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._job_slots.release()
+            raise
+        pending.add(future)
+        future.add_done_callback(lambda f: (pending.discard(f), self._job_slots.release()))
+
+    def _fast_copy(self, src_file, dest_file, dest, compare=True, dest_entry=None):
+        try:
+            # On Linux the first DirEntry.stat() is still a stat call; it's cached after that
+            src_stat = src_file.stat()
+            dest_key = os.fspath(dest_file)
+            records = self.copy_records(dest)
+            if dest_entry is not None and dest_entry.is_dir(follow_symlinks=False):
+                # The source directory was replaced by a file
+                shutil.rmtree(dest_file)
+                self._forget(dir_paths=[dest_file])
+                dest_entry = None
+            if compare:
+                # A mirror file we copied or matched before, still the same inode from the
+                # directory listing, needs no stat while its source is unchanged
+                if (dest_entry is not None and records is not None and records.get(dest_key) ==
+                        (src_stat.st_size, src_stat.st_mtime_ns, dest_entry.inode())):
+                    return
+                # Compared in the worker so mirror-side stats overlap across files
+                if files_equal(src_file, dest_entry or dest_file, self.verify, self.file_checksum,
+                               self.mtime_tolerance(dest)):
+                    if dest_entry is not None and records is not None:
+                        records[dest_key] = (src_stat.st_size, src_stat.st_mtime_ns, dest_entry.inode())
+                    return
+            file_size = src_stat.st_size
+            logger.debug("Copying file %s", dest_file)
+            if self._reserve_space(dest, file_size):
+                copied = False
+                try:
+                    fast_copy(src_file, dest_file)
+                    copied = True
+                except OSError as e:
+                    if e.errno != errno.ENOSPC:
+                        raise
+                    # The estimate can lag behind other writers; don't leave a truncated copy
+                    # taking up what space is left
+                    logger.warning("Drive filled up while copying file %s. Skipping.", dest_file)
+                    self._count_failure()
                     try:
                         os.remove(dest_file)
-                        print(f"Deleted file {dest_file}")
-                    except Exception as e:
-                        print(f"Error deleting file {dest_file}: {e}")
-            # Delete directories not present in source
-            for dir in dirs:
-                dest_subdir = Path(root) / dir
-                src_subdir = src_dir / dir
-                if not src_subdir.exists():
-                    try:
-                        shutil.rmtree(dest_subdir)
-                        print(f"Deleted directory {dest_subdir}")
-                    except Exception as e:
-                        print(f"Error deleting directory {dest_subdir}: {e}")
+                    except OSError:
+                        pass
+                    return
+                finally:
+                    self._release_space(dest, file_size, copied)
+                if records is not None:
+                    records[dest_key] = (src_stat.st_size, src_stat.st_mtime_ns, os.stat(dest_file).st_ino)
+                logger.debug("Copied file %s", dest_file)
+                self._count_progress(copied_bytes=file_size)
+            else:
+                logger.warning("Not enough space to copy file %s. Skipping.", dest_file)
+                self._count_failure()
+        except Exception as e:
+            logger.error("Error copying file %s: %s", dest_file, e)
+            self._count_failure()
+
+    def _count_progress(self, copied_bytes=None, deleted=0):
+        # Per-file lines are debug only, so summarise progress at most once per PROGRESS_INTERVAL
+        with self.progress_lock:
+            if copied_bytes is not None:
+                self._progress['files'] += 1
+                self._progress['bytes'] += copied_bytes
+            self._progress['deleted'] += deleted
+            if time.monotonic() - self._last_progress >= PROGRESS_INTERVAL:
+                self._log_progress()
+
+    def flush_progress(self):
+        """Log the progress not summarised yet, so it isn't folded into the next pass."""
+        with self.progress_lock:
+            if any(self._progress.values()):
+                self._log_progress()
+
+    def _log_progress(self):
+        # Caller holds progress_lock
+        logger.info("Copied %d files (%.1f MiB), deleted %d entries",
+                    self._progress['files'], self._progress['bytes'] / (1 << 20), self._progress['deleted'])
+        self._progress = {'files': 0, 'bytes': 0, 'deleted': 0}
+        self._last_progress = time.monotonic()
+
+    def _count_failure(self):
+        # Any failure means a mirror may be incomplete, so sync_directory won't mark it in sync
+        with self.progress_lock:
+            self._failures += 1
+
+    def _invalidate_free_space(self, drive):
+        with self.space_lock:
+            self._free_space.pop(str(drive), None)
+
+    def _refresh_free_space(self, drive):
+        # Copies in flight are only partly on disk yet, so keep them reserved
+        self._free_space[drive] = self.get_available_space(drive) - self._in_flight_space.get(drive, 0)
+        self._debited_space[drive] = 0
+        self._free_space_read[drive] = time.monotonic()
+
+    def _reserve_space(self, drive, required_space):
+        # Free space is read with statvfs once, then debited locally for every copy until
+        # the local estimate has drifted by SPACE_RESYNC_BYTES
+        drive = str(drive)
+        with self.space_lock:
+            if (drive not in self._free_space or self._debited_space[drive] >= SPACE_RESYNC_BYTES
+                    or time.monotonic() - self._free_space_read[drive] >= SPACE_RESYNC_INTERVAL):
+                self._refresh_free_space(drive)
+            if self._free_space[drive] < required_space:
+                # Deletions aren't credited locally, so check the real figure before giving up
+                self._refresh_free_space(drive)
+                if self._free_space[drive] < required_space:
+                    return False
+            self._free_space[drive] -= required_space
+            self._debited_space[drive] += required_space
+            self._in_flight_space[drive] = self._in_flight_space.get(drive, 0) + required_space
+            return True
+
+    def _release_space(self, drive, required_space, copied):
+        drive = str(drive)
+        with self.space_lock:
+            self._in_flight_space[drive] -= required_space
+            if not copied:
+                # A failed copy may have left a partial file or hit ENOSPC, so re-read statvfs
+                self._free_space.pop(drive, None)
+
+    def delete_extra_files(self, src, dest):
+        pending = set()
+        src_root = os.fspath(src)
+        dest_root = os.fspath(dest)
+        for root, dirs, files in walk_entries(dest_root, onerror=lambda e: self._count_failure()):
+            src_dir = src_root + root[len(dest_root):]
+            # A directory's mtime changes whenever entries are added to or removed from it, so a
+            # level whose mtimes match the last clean pass on both sides can't have extra entries.
+            # Its subdirectories are still visited: their changes don't bubble up to the parent.
+            try:
+                fingerprint = (os.stat(src_dir).st_mtime_ns, os.stat(root).st_mtime_ns)
+            except FileNotFoundError:
+                fingerprint = None
+            if fingerprint is not None and self._dir_fingerprints.get(root) == fingerprint:
+                continue
+            # One listing of the source directory instead of an exists() stat per mirror entry
+            try:
+                with os.scandir(src_dir) as it:
+                    src_names = {src_entry.name for src_entry in it}
+            except (FileNotFoundError, NotADirectoryError):
+                src_names = set()
+            except OSError as e:
+                logger.error("Error scanning directory %s: %s", src_dir, e)
+                self._count_failure()
+                dirs[:] = []
+                continue
+            # Delete files and directories not present in source, without descending into them
+            extra_files = [entry.name for entry in files if entry.name not in src_names]
+            extra_dirs = [entry.name for entry in dirs if entry.name not in src_names]
+            if extra_dirs:
+                dirs[:] = [entry for entry in dirs if entry.name in src_names]
+            if extra_files or extra_dirs:
+                self._submit(pending, self._delete_entries, root, extra_files, extra_dirs)
+            elif fingerprint is not None:
+                self._dir_fingerprints[root] = fingerprint
+        wait(pending.copy())
+
+    def _delete_entries(self, dest_dir, file_names, dir_names):
+        # Unlinking relative to one open directory resolves a single name per file instead of
+        # the whole path again. Unlinks in one directory serialise on its lock in the kernel,
+        # so they gain nothing from being spread over several workers.
+        try:
+            dir_fd = os.open(dest_dir, os.O_RDONLY | os.O_DIRECTORY) if os.unlink in os.supports_dir_fd else None
+        except OSError as e:
+            logger.error("Error opening directory %s: %s", dest_dir, e)
+            self._count_failure()
+            return
+        try:
+            for name in file_names:
+                dest_file = os.path.join(dest_dir, name)
+                try:
+                    os.unlink(dest_file if dir_fd is None else name, dir_fd=dir_fd)
+                    logger.debug("Deleted file %s", dest_file)
+                    self._count_progress(deleted=1)
+                except Exception as e:
+                    logger.error("Error deleting file %s: %s", dest_file, e)
+                    self._count_failure()
+        finally:
+            if dir_fd is not None:
+                os.close(dir_fd)
+        for name in dir_names:
+            # rmtree already walks the tree through directory fds where the platform allows
+            dest_subdir = os.path.join(dest_dir, name)
+            try:
+                shutil.rmtree(dest_subdir)
+                logger.debug("Deleted directory %s", dest_subdir)
+                self._count_progress(deleted=1)
+            except Exception as e:
+                logger.error("Error deleting directory %s: %s", dest_subdir, e)
+                self._count_failure()
+        self._forget([os.path.join(dest_dir, name) for name in file_names],
+                     [os.path.join(dest_dir, name) for name in dir_names])
 
     def monitor_drives(self):
         observer = pyudev.MonitorObserver(self.monitor, callback=self.device_event)
@@ -137,145 +687,332 @@ class SyncManager:
         if not device.device_node:
             return
             
-        # Find the mount point for this device
-        partitions = psutil.disk_partitions(all=True)
-        for partition in partitions:
-            if partition.device == device.device_node:
-                mount_point = partition.mountpoint
-                if mount_point in self.mirror_drives:
-                    action = device.action
-                    if action == 'add' or action == 'change':
-                        print(f"Drive {mount_point} mounted.")
-                        print(f"Syncing drive {mount_point} ...")
-                        with self.lock:
-                            self.mounted_drives.add(mount_point)
-                            self.sync_directory(mount_point)
-                    elif action == 'remove':
-                        print(f"Drive {mount_point} unmounted.")
-                        with self.lock:
-                            self.mounted_drives.discard(mount_point)
-                    elif action == 'move':
-                        print(f"Drive {mount_point} renamed/moved.")
-                    else:
-                        print("Error: Unhandled device event.")
+        # The device may have been mounted or unmounted, so re-read the mount table. A removed
+        # device is usually gone from the new table already, so look it up in the old one;
+        # the new one is still built now, for the next event to look back at.
+        previous = self._mount_table or {}
+        self._mtime_tolerances = {}
+        self._mirror_identities = {}
+        current = self.mount_table(refresh=True)
+        table = previous if device.action == 'remove' else current
+        for mount_point, partition in table.items():
+            if partition.device == device.device_node and mount_point in self._mount_point_drives:
+                self.drive_event(device.action, self._mount_point_drives[mount_point])
 
-    def update_changes(self, src_path):
-        with self.lock:
-            for drive in list(self.mounted_drives):
-                destination = Path(drive) / self.dir_to_watch.name
-                try:
-                    relative_path = Path(src_path).relative_to(self.dir_to_watch)
-                except ValueError:
-                    # src_path is not under dir_to_watch
+    def drive_event(self, action, drive):
+        # Something else may have written to the drive
+        self._invalidate_free_space(self.destination(drive))
+        if action == 'add' or action == 'change':
+            logger.info("Drive %s mounted.", drive)
+            logger.info("Syncing drive %s ...", drive)
+            with self._drives_lock:
+                self.mounted_drives.add(drive)
+            self.sync_directory(drive)
+        elif action == 'remove':
+            logger.info("Drive %s unmounted.", drive)
+            with self._drives_lock:
+                self.mounted_drives.discard(drive)
+        elif action == 'move':
+            logger.info("Drive %s renamed/moved.", drive)
+        else:
+            logger.error("Unhandled device event %s for %s.", action, drive)
+
+    def update_changes(self, src_path, drives=None):
+        """Copy a created or modified path to drives, by default every mounted drive.
+
+        Returns the drives skipped because a sync pass held their lock.
+        """
+        try:
+            relative_path = Path(src_path).relative_to(self.dir_to_watch)
+        except ValueError:
+            # src_path is not under dir_to_watch
+            return []
+        src_path_obj = Path(src_path)
+        # One stat tells every drive whether the path still exists and whether it's a directory
+        try:
+            src_is_dir = stat.S_ISDIR(src_path_obj.stat().st_mode)
+            src_exists = True
+        except FileNotFoundError:
+            src_is_dir = src_exists = False
+        if not src_exists:
+            # src_path has been deleted, remove it from the mirrors
+            return self.delete_path(src_path, drives)
+        busy = []
+        for drive in self.mounted() if drives is None else drives:
+            with self._try_drive_lock(drive) as locked:
+                if not locked:
+                    busy.append(drive)
                     continue
+                destination = self.destination(drive)
                 dest_path = destination / relative_path
-                src_path_obj = Path(src_path)
-                if src_path_obj.exists():
-                    if src_path_obj.is_dir():
-                        if not dest_path.exists():
-                            try:
-                                dir_size = self.calculate_directory_size(src_path_obj)
-                                print(f"Copying directory {dest_path}")
-                                if self.has_enough_space(destination, dir_size):
-                                    shutil.copytree(src_path_obj, dest_path)
-                                    print(f"Copied directory {dest_path}")
-                                else:
-                                    print(f"Not enough space to copy directory {dest_path}. Skipping.")
-                            except Exception as e:
-                                print(f"Error copying directory {dest_path}: {e}")
-                        else:
-                            self.copy_missing_files(src_path_obj, dest_path)
-                            print(f"Drive {drive} synced")
-                    else:
-                        dest_path.parent.mkdir(parents=True, exist_ok=True)
-                        try:
-                            file_size = src_path_obj.stat().st_size
-                            print(f"Copying file {dest_path}")
-                            if self.has_enough_space(destination, file_size):
-                                shutil.copy2(src_path_obj, dest_path)
-                                print(f"Copied file {dest_path}")
-                            else:
-                                print(f"Not enough space to copy file {dest_path}. Skipping.")
-                        except Exception as e:
-                            print(f"Error copying file {dest_path}: {e}")
+                if src_is_dir:
+                    self.copy_missing_files(src_path_obj, dest_path, destination)
+                    logger.debug("Drive %s synced", drive)
                 else:
-                    # src_path has been deleted, remove from destination
-                    if dest_path.exists():
-                        try:
-                            if dest_path.is_dir():
-                                shutil.rmtree(dest_path)
-                                print(f"Deleted directory {dest_path}")
-                            else:
-                                os.remove(dest_path)
-                                print(f"Deleted file {dest_path}")
-                        except Exception as e:
-                            print(f"Error deleting {dest_path}: {e}")
-            # After updating changes, ensure no extra files exist
-            for drive in list(self.mounted_drives):
-                destination = Path(drive) / self.dir_to_watch.name
-                self.delete_extra_files(self.dir_to_watch, destination)
-                print(f"Drive {drive} synced")
-
-    def handle_move(self, src_path, dest_path):
+                    dest_path.parent.mkdir(parents=True, exist_ok=True)
+                    # The watcher reported a change, so copy without comparing
+                    self._fast_copy(src_path_obj, dest_path, destination, compare=False)
+        return busy
+
+    def delete_path(self, src_path, drives=None):
+        """Remove the mirrored copy of a deleted file or directory from drives.
+
+        drives defaults to every mounted drive. Returns the drives skipped because a
+        sync pass held their lock.
+        """
+        try:
+            relative_path = Path(src_path).relative_to(self.dir_to_watch)
+        except ValueError:
+            # src_path is not under dir_to_watch
+            return []
+        busy = []
+        for drive in self.mounted() if drives is None else drives:
+            with self._try_drive_lock(drive) as locked:
+                if not locked:
+                    busy.append(drive)
+                    continue
+                dest_path = self.destination(drive) / relative_path
+                try:
+                    dest_mode = os.lstat(dest_path).st_mode
+                except FileNotFoundError:
+                    continue
+                try:
+                    if stat.S_ISDIR(dest_mode):
+                        shutil.rmtree(dest_path)
+                        self._forget(dir_paths=[dest_path])
+                        logger.debug("Deleted directory %s", dest_path)
+                    else:
+                        os.remove(dest_path)
+                        self._forget(file_paths=[dest_path])
+                        logger.debug("Deleted file %s", dest_path)
+                    self._count_progress(deleted=1)
+                except Exception as e:
+                    logger.error("Error deleting %s: %s", dest_path, e)
+        return busy
+
+    def handle_move(self, src_path, dest_path, drives=None):
+        """Rename a moved path on drives, by default every mounted drive.
+
+        Returns the drives skipped because a sync pass held their lock.
+        """
         relative_path = Path(src_path).relative_to(self.dir_to_watch)
         relative_new_path = Path(dest_path).relative_to(self.dir_to_watch)
-        for drive in list(self.mounted_drives):
-            destination = Path(drive) / self.dir_to_watch.name
-            old_dest_path = destination / relative_path
-            new_dest_path = destination / relative_new_path
-            if old_dest_path.exists():
+        busy = []
+        for drive in self.mounted() if drives is None else drives:
+            with self._try_drive_lock(drive) as locked:
+                if not locked:
+                    busy.append(drive)
+                    continue
+                destination = self.destination(drive)
+                old_dest_path = destination / relative_path
+                new_dest_path = destination / relative_new_path
                 try:
-                    new_dest_path.parent.mkdir(parents=True, exist_ok=True)
-                    print(f"Copying (rename) {old_dest_path} to {new_dest_path}")
-                    if self.has_enough_space(destination, 0):  # Rename doesn't require additional space
-                        old_dest_path.rename(new_dest_path)
-                        print(f"Renamed {old_dest_path} to {new_dest_path} on drive {drive}")
+                    try:
+                        move_path(old_dest_path, new_dest_path)
+                    except FileNotFoundError:
+                        if not os.path.lexists(old_dest_path):
+                            # The mirror never had the old path, so copy the new one over directly
+                            self._copy_moved(Path(dest_path), new_dest_path, destination)
+                            continue
+                        new_dest_path.parent.mkdir(parents=True, exist_ok=True)
+                        move_path(old_dest_path, new_dest_path)
+                    if os.path.isdir(new_dest_path):
+                        self._forget(dir_paths=[old_dest_path])
                     else:
-                        print(f"Not enough space to rename {old_dest_path} to {new_dest_path} on drive {drive}. Skipping.")
+                        self._forget(file_paths=[old_dest_path])
+                    logger.debug("Renamed %s to %s on drive %s", old_dest_path, new_dest_path, drive)
                 except Exception as e:
-                    print(f"Error renaming {old_dest_path} to {new_dest_path} on drive {drive}: {e}")
-            else:
-                # If the old path doesn't exist on the mirror, perform a regular update
-                self.update_changes(dest_path)
-
-    def calculate_directory_size(self, path):
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(path):
-            for f in filenames:
-                fp = os.path.join(dirpath, f)
-                if os.path.exists(fp):
-                    total_size += os.path.getsize(fp)
-        return total_size
+                    logger.error("Error renaming %s to %s on drive %s: %s", old_dest_path, new_dest_path, drive, e)
+        return busy
+
+    def _copy_moved(self, src_path, dest_path, destination):
+        try:
+            src_is_dir = stat.S_ISDIR(src_path.stat().st_mode)
+        except FileNotFoundError:
+            # Moved again or deleted since; a later event covers wherever it went
+            return
+        if src_is_dir:
+            self.copy_missing_files(src_path, dest_path, destination)
+        else:
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            self._fast_copy(src_path, dest_path, destination)
 
 class DirectoryEventHandler(FileSystemEventHandler):
     def __init__(self, sync_manager):
         super().__init__()
         self.sync_manager = sync_manager
+        self.events = queue.Queue()
+        # Mirror drive -> events held back while a sync pass held its lock, in order
+        self.deferred = {}
+        self.worker = threading.Thread(target=self.process_events, daemon=True)
+
+    def start(self):
+        self.worker.start()
+
+    def stop(self):
+        """Finish the events already queued, then stop the worker thread.
+
+        Events still held back for a drive busy with a sync pass are dropped.
+        """
+        self.events.put(None)
+        self.worker.join()
 
     def on_created(self, event):
         if not event.is_directory:
-            print(f"File created: {event.src_path}")
-            self.sync_manager.update_changes(event.src_path)
+            logger.debug("File created: %s", event.src_path)
         else:
-            print(f"Directory created: {event.src_path}")
-            self.sync_manager.update_changes(event.src_path)
+            logger.debug("Directory created: %s", event.src_path)
+        self.events.put(('update', event.src_path))
 
     def on_modified(self, event):
         if not event.is_directory:
-            print(f"File modified: {event.src_path}")
-            self.sync_manager.update_changes(event.src_path)
+            logger.debug("File modified: %s", event.src_path)
+            self.events.put(('update', event.src_path))
 
     def on_moved(self, event):
         if not event.is_directory:
-            print(f"File moved: from {event.src_path} to {event.dest_path}")
-            self.sync_manager.handle_move(event.src_path, event.dest_path)
+            logger.debug("File moved: from %s to %s", event.src_path, event.dest_path)
         else:
-            print(f"Directory moved: from {event.src_path} to {event.dest_path}")
-            self.sync_manager.handle_move(event.src_path, event.dest_path)
+            logger.debug("Directory moved: from %s to %s", event.src_path, event.dest_path)
+        self.events.put(('move', event.src_path, event.dest_path))
 
     def on_deleted(self, event):
-        print(f"{'Directory' if event.is_directory else 'File'} deleted: {event.src_path}")
-        self.sync_manager.update_changes(event.src_path)
+        logger.debug("%s deleted: %s", 'Directory' if event.is_directory else 'File', event.src_path)
+        self.events.put(('delete', event.src_path))
+
+    def process_events(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                # Wake up now and then to retry drives that were busy
+                event = self.events.get(timeout=BUSY_DRIVE_RETRY if self.deferred else None)
+            except queue.Empty:
+                event = ()
+            if event is None:
+                break
+            if event:
+                batch.append(event)
+                # Keep collecting until the directory has been quiet for a debounce window
+                deadline = time.monotonic() + EVENT_BATCH_MAX_WAIT
+                while time.monotonic() < deadline:
+                    try:
+                        event = self.events.get(timeout=EVENT_DEBOUNCE)
+                    except queue.Empty:
+                        break
+                    if event is None:
+                        # stop() was called; sync what has been collected, then exit
+                        stopping = True
+                        break
+                    batch.append(event)
+            self.process_batch(batch)
+            if self.events.empty() and not self.deferred:
+                self.sync_manager.changes_synced.set()
+
+    def parents(self, path):
+        """Yield the ancestors of path up to, but not including, the watched directory."""
+        top = os.fspath(self.sync_manager.dir_to_watch)
+        parent = os.path.dirname(path)
+        while parent != path and parent != top:
+            yield parent
+            path, parent = parent, os.path.dirname(parent)
+
+    def process_batch(self, batch):
+        """Sync a batch of events to every mounted drive, holding back events for busy drives.
+
+        A drive whose lock a sync pass holds (one that was just plugged in) would stall
+        every other drive's changes if waited for. Its events wait in self.deferred
+        instead, and later batches queue behind them so each drive sees events in order.
+        """
+        mounted = self.sync_manager.mounted()
+        # An unmounted drive gets a full sync pass when it's mounted again
+        for drive in list(self.deferred):
+            if drive not in mounted:
+                del self.deferred[drive]
+        for events in self.deferred.values():
+            events.extend(batch)
+        drives = [drive for drive in mounted if drive not in self.deferred]
+        if batch and drives:
+            events = self.coalesce(batch)
+            for drive, start in self.sync_events(events, drives).items():
+                self.deferred[drive] = events[start:]
+        for drive, events in list(self.deferred.items()):
+            events = self.coalesce(events)
+            start = self.sync_events(events, [drive]).get(drive)
+            if start is None:
+                del self.deferred[drive]
+            else:
+                self.deferred[drive] = events[start:]
+        self.sync_manager.flush_progress()
+
+    def coalesce(self, batch):
+        """Return the events of batch that still need syncing, in order."""
+        # Updates run against the source as it is now, so one made before a move can't
+        # bring the mirror's old copy up to date; sync the moved path once it's renamed
+        updated = set()
+        expanded = []
+        for event in batch:
+            expanded.append(event)
+            if event[0] == 'update':
+                updated.add(event[1])
+            elif event[0] == 'move' and any(path == event[1] or path.startswith(event[1] + os.sep)
+                                            for path in updated):
+                expanded.append(('update', event[2]))
+        # Updates and deletes act on the current state of a path, so only its last event
+        # matters, except that a delete before the last update must still run first: the
+        # path may have come back as a different type (rm x; mkdir x), and the update
+        # can't replace a mirrored file with a directory or the other way round
+        kept = {}
+        coalesced = []
+        for event in reversed(expanded):
+            if event[0] == 'move':
+                # A move carries the mirror's current copy to a new path, so events from
+                # before it must run first even if the path was updated again afterwards
+                # (append to a log, rotate it, start a new one)
+                kept.clear()
+            else:
+                later = kept.get(event[1])
+                if later is not None and not (later == 'update' and event[0] == 'delete'):
+                    continue
+                kept[event[1]] = event[0]
+            coalesced.append(event)
+        coalesced.reverse()
+        if not any(event[0] == 'move' for event in coalesced):
+            # Copying or deleting a directory covers everything beneath it, except that
+            # a directory update never deletes, so deletes below it must still run
+            covered = {
+                'update': {event[1] for event in coalesced},
+                'delete': {event[1] for event in coalesced if event[0] == 'delete'},
+            }
+            coalesced = [event for event in coalesced
+                         if not any(parent in covered[event[0]] for parent in self.parents(event[1]))]
+        return coalesced
+
+    def sync_events(self, events, drives):
+        """Sync events to drives in order.
+
+        Returns {drive: index of the first event it was busy for}; the events from
+        there on were not synced to that drive.
+        """
+        held = {}
+        drives = list(drives)
+        for index, event in enumerate(events):
+            if not drives:
+                break
+            try:
+                if event[0] == 'move':
+                    busy = self.sync_manager.handle_move(event[1], event[2], drives)
+                elif event[0] == 'delete':
+                    busy = self.sync_manager.delete_path(event[1], drives)
+                else:
+                    busy = self.sync_manager.update_changes(event[1], drives)
+            except Exception as e:
+                logger.error("Error syncing %s: %s", event[1], e)
+                continue
+            for drive in busy:
+                held[drive] = index
+                drives.remove(drive)
+        return held
 
 def get_available_drives():
     """Get list of mounted drives excluding root partition."""
@@ -395,6 +1132,11 @@ Examples:
                        help="Path to the directory to monitor/watch")
     parser.add_argument("--mirror-drives", nargs='+', 
                        help="List of mirror drive mount points")
+    parser.add_argument("--verbose", "-v", action="store_true",
+                       help="Log every file copied, deleted or renamed")
+    parser.add_argument("--verify", action="store_true",
+                       help="Checksum files whose size matches but modification time differs, "
+                            "instead of recopying them")
     
     # If no arguments provided, print help and exit
     if len(sys.argv) == 1:
@@ -404,39 +1146,239 @@ Examples:
     args = parser.parse_args()
     
     if args.interactive:
-        return interactive_selection()
+        return (*interactive_selection(), args.verbose, args.verify)
     elif args.dir_to_watch and args.mirror_drives:
-        return args.dir_to_watch, args.mirror_drives
+        return args.dir_to_watch, args.mirror_drives, args.verbose, args.verify
     else:
-        return interactive_selection()
+        return (*interactive_selection(), args.verbose, args.verify)
+
+def start_watching(sync_manager):
+    """Start mirroring changes under the watched directory.
+
+    Returns the running observer and its event handler, whose worker must be
+    stopped after the observer so no queued change is lost.
+    """
+    event_handler = DirectoryEventHandler(sync_manager)
+    event_handler.start()
+    if sys.platform.startswith('linux'):
+        observer = InotifyObserver()
+    else:
+        observer = PollingObserver(timeout=POLLING_INTERVAL)
+    observer.schedule(event_handler, path=str(sync_manager.dir_to_watch), recursive=True,
+                      event_filter=WATCHED_EVENTS)
+    observer.start()
+    return observer, event_handler
 
 def main():
     args = parse_arguments()
-    sync_manager = SyncManager(args[0], args[1])
+    logging.basicConfig(level=logging.DEBUG if args[2] else logging.INFO, format="%(message)s")
+    sync_manager = SyncManager(args[0], args[1], verify=args[3])
     sync_manager.initial_sync()
 
     drive_thread = threading.Thread(target=sync_manager.monitor_drives, daemon=True)
     drive_thread.start()
 
-    event_handler = DirectoryEventHandler(sync_manager)
-    observer = Observer()
-    observer.schedule(event_handler, path=str(sync_manager.dir_to_watch), recursive=True)
-    observer.start()
+    observer, event_handler = start_watching(sync_manager)
 
-    print("Monitoring started. Press Ctrl+C to stop.")
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        observer.stop()
+    # Block until Ctrl+C or SIGTERM instead of waking up every second
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    logger.info("Monitoring started. Press Ctrl+C to stop.")
+    stop.wait()
+    observer.stop()
     observer.join()
+    # Drain the event worker before saving, so the caches are no longer changing
+    event_handler.stop()
+    sync_manager.shutdown()
 
 def file_checksum(path):
-    hash_func = hashlib.sha256()
-    with open(path, 'rb') as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_func.update(chunk)
+    # Read, never mmap: the watched files are often still being written, and a file
+    # truncated under a mapping kills the whole process with SIGBUS
+    with open(path, 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= PARALLEL_HASH_MIN_SIZE and hasattr(checksum_hash, 'AUTO'):
+            # BLAKE3 hashes large inputs as a tree across its own thread pool, given
+            # chunks big enough to split between the threads
+            hash_func = checksum_hash(max_threads=checksum_hash.AUTO)
+            buf = bytearray(PARALLEL_HASH_CHUNK)
+        elif size < UNCACHED_HASH_MIN_SIZE and hasattr(hashlib, 'file_digest'):
+            # Python 3.11+ runs the read loop in C
+            return hashlib.file_digest(f, checksum_hash).hexdigest()
+        else:
+            hash_func = checksum_hash()
+            buf = _thread_buffers(1)[0]
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        with memoryview(buf) as view:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                hash_func.update(view[:n])
+        if size >= UNCACHED_HASH_MIN_SIZE and hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
     return hash_func.hexdigest()
 
+def fast_copy(src, dst):
+    """Copy a file like shutil.copy2, letting the kernel move the data where it can.
+
+    Tries a FICLONE reflink, then os.copy_file_range, then os.sendfile, and
+    falls back to copying through this thread's reusable buffer.
+    """
+    with open(src, 'rb', buffering=0) as fsrc, open(dst, 'wb', buffering=0) as fdst:
+        if not _kernel_copy(fsrc.fileno(), fdst.fileno(), os.fstat(fsrc.fileno()).st_size):
+            _buffered_copy(fsrc, fdst)
+    shutil.copystat(src, dst)
+    return dst
+
+def _buffered_copy(fsrc, fdst):
+    """Copy between two unbuffered files through this thread's reusable buffer."""
+    buf = _thread_buffers(1)[0]
+    with memoryview(buf) as view:
+        while True:
+            n = fsrc.readinto(buf)
+            if not n:
+                break
+            written = 0
+            while written < n:
+                written += fdst.write(view[written:n])
+
+def _thread_buffers(count):
+    """Return count I/O buffers owned by the calling thread, allocating them on first use."""
+    buffers = getattr(_local, 'buffers', None)
+    if buffers is None:
+        buffers = _local.buffers = []
+    while len(buffers) < count:
+        buffers.append(bytearray(IO_BUFFER_SIZE))
+    return buffers
+
+def _readinto_full(f, buf):
+    """Fill buf from an unbuffered file, returning fewer bytes than len(buf) only at EOF."""
+    total = 0
+    with memoryview(buf) as view:
+        while total < len(buf):
+            n = f.readinto(view[total:])
+            if not n:
+                break
+            total += n
+    return total
+
+def _kernel_copy(src_fd, dst_fd, size):
+    """Copy src_fd into dst_fd without a user-space buffer.
+
+    Returns False, having copied nothing, if no syscall works for this pair of files.
+    """
+    if FICLONE is not None:
+        try:
+            # Share the source's extents on Btrfs/XFS, completing in O(1) whatever the size
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            return True
+        except OSError:
+            # Cloning either fully succeeds or leaves dst untouched
+            pass
+    methods = []
+    if hasattr(os, 'copy_file_range'):
+        methods.append(lambda: os.copy_file_range(src_fd, dst_fd, KERNEL_COPY_CHUNK))
+    if hasattr(os, 'sendfile'):
+        methods.append(lambda: os.sendfile(dst_fd, src_fd, None, KERNEL_COPY_CHUNK))
+    for copy_chunk in methods:
+        try:
+            copied = copy_chunk()
+        except OSError as e:
+            if e.errno in KERNEL_COPY_UNSUPPORTED:
+                continue
+            raise
+        if copied == 0 and size > 0:
+            # Some filesystems report success without copying anything
+            continue
+        while copied:
+            copied = copy_chunk()
+        return True
+    return False
+
+def move_path(src, dst):
+    """Atomically rename src to dst, copying and removing src if they're on different filesystems."""
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        if os.path.isdir(src):
+            shutil.copytree(src, dst, copy_function=fast_copy, dirs_exist_ok=True)
+            shutil.rmtree(src)
+        else:
+            fast_copy(src, dst)
+            os.unlink(src)
+
+def walk_entries(top, onerror=None):
+    """Walk a tree top-down like os.walk, but yield os.DirEntry lists instead of names.
+
+    Files and directories are told apart from the type scandir already returned, with
+    no stat call where the filesystem reports it (d_type on Linux). Full stat data is
+    only free on Windows; elsewhere the first DirEntry.stat() makes a stat call and
+    caches the result.
+    Callers may prune dirs in place to skip descending into them. Like os.walk,
+    onerror is called with the OSError for directories that can't be listed.
+    """
+    stack = [os.fspath(top)]
+    while stack:
+        root = stack.pop()
+        dirs = []
+        files = []
+        try:
+            with os.scandir(root) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        dirs.append(entry)
+                    else:
+                        files.append(entry)
+        except OSError as e:
+            logger.error("Error scanning directory %s: %s", root, e)
+            if onerror is not None:
+                onerror(e)
+            continue
+        yield root, dirs, files
+        # Like os.walk, list symlinked directories but don't follow them
+        stack.extend(entry.path for entry in reversed(dirs) if not entry.is_symlink())
+
+def files_equal(src, dst, verify=False, checksum=None, mtime_tolerance_ns=0):
+    """Compare two files by size and mtime, reading contents only if verify is set.
+
+    A missing dst is never equal. The mtimes must match to within mtime_tolerance_ns,
+    which is only nonzero for mirrors that store coarse timestamps. When verifying,
+    checksum (e.g. a cached digest lookup) is compared if given, otherwise the files
+    are compared byte by byte.
+    """
+    try:
+        dst_stat = dst.stat() if isinstance(dst, os.DirEntry) else os.stat(dst)
+    except FileNotFoundError:
+        return False
+    src_stat = src.stat() if isinstance(src, os.DirEntry) else os.stat(src)
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if abs(src_stat.st_mtime_ns - dst_stat.st_mtime_ns) <= mtime_tolerance_ns:
+        return True
+    if not verify:
+        return False
+    if checksum is not None:
+        return checksum(src) == checksum(dst)
+    return contents_equal(src, dst)
+
+def contents_equal(src, dst):
+    """Compare two files chunk by chunk, stopping at the first difference."""
+    buf1, buf2 = _thread_buffers(2)
+    with open(src, 'rb', buffering=0) as f1, open(dst, 'rb', buffering=0) as f2:
+        while True:
+            n1 = _readinto_full(f1, buf1)
+            n2 = _readinto_full(f2, buf2)
+            if n1 != n2:
+                return False
+            if n1 < len(buf1):
+                return buf1[:n1] == buf2[:n2]
+            # Full buffers compare with memcmp, without slicing copies
+            if buf1 != buf2:
+                return False
+
 if __name__ == "__main__":
     main()